@@ -1,8 +1,12 @@
 from random_username.generate import generate_username
-from random import randint
-import json
-from datetime import datetime
-import requests
+from random import randint, uniform, choice
+import orjson
+import sys
+import time
+import asyncio
+from array import array
+import heapq
+import aiohttp
 from configparser import ConfigParser
 
 """
@@ -39,65 +43,126 @@ def print_error(text):
 
 
 def _print(status, text):
-    print(f'{datetime.now().strftime("%d.%m.%y %H:%M:%S")} [{status}]: {text}')
+    print(f'{time.strftime("%d.%m.%y %H:%M:%S")} [{status}]: {text}')
+
+
+def _retry_after(response):
+    """
+    :param response: aiohttp response
+    :return: delay in seconds from Retry-After header or None if absent
+    """
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_flag(section, key):
+    """
+    Reads boolean setting. Empty value (as well as missing one) means False
+    :param section: section of settings.ini
+    :param key: name of the setting
+    :return: value of the setting
+    """
+    if not section.get(key, '').strip():
+        return False
+    try:
+        return section.getboolean(key)
+    except ValueError as e:
+        raise ValueError(f'Setting {key} must be True or False, got "{section.get(key)}"') from e
+
+
+def _get_int(section, key, fallback, minimum):
+    """
+    Reads integer setting that can't be less than given minimum
+    :param section: section of settings.ini
+    :param key: name of the setting
+    :param fallback: value if the setting is missing
+    :param minimum: minimal allowed value
+    :return: value of the setting
+    """
+    value = section.getint(key, fallback=fallback)
+    if value < minimum:
+        raise ValueError(f'Setting {key} must be at least {minimum}, got {value}')
+    return value
 
 
 class User:
+    __slots__ = ('bot', 'username', 'post_ids', 'post_likes', '_zero_like_posts', 'posts_liked',
+                 'access_token', '_cached_headers')
+
     def __init__(self, bot, username):
         self.bot = bot
         self.username = username
-        self.own_posts_with_likes = {}
+        # own posts and number of likes of each post, item i of post_likes belongs to post_ids[i]
+        self.post_ids = []
+        self.post_likes = array('i')
+        self._zero_like_posts = set()  # own posts with no likes, kept in sync with post_likes
         self.posts_liked = set()
 
         self.access_token = ''
+        self._cached_headers = {}  # built once per log in, see self._headers
 
     @property
     def posts_count(self):
         """
         :return: count of posts created by the user
         """
-        return len(self.own_posts_with_likes.keys())
+        return len(self.post_ids)
 
-    def sign_up(self, password, email):
+    async def sign_up(self, password, email):
         """
         Sign-up the user in social network
         :param password:
         :param email:
         """
         if not self.bot.settings.fake_api:
-            response = requests.post(url=self.bot.settings.base_url + "user/signup/",
-                                     json={
-                                         'user': {
-                                             'username': self.username,
-                                             'password': password
-                                         },
-                                         'email': email
-                                     })
-            if response.status_code != 200 or response.json().get('status') != 'success':
-                raise Exception(response.json().get('message'))
-        print_info(f'User {self.username} registered')
-
-    def login(self):
+            # 5xx is not retried: the user might be registered already and repeated sign-up would fail
+            status, data = await self.bot.request('POST', "user/signup/", retry_server_errors=False,
+                                                  json={
+                                                      'user': {
+                                                          'username': self.username,
+                                                          'password': password
+                                                      },
+                                                      'email': email
+                                                  })
+            if status != 200 or data.get('status') != 'success':
+                raise Exception(f'HTTP {status}: {data.get("message")}')
+        self._print_action(f'User {self.username} registered')
+
+    async def login(self):
         """
         Login user to allow making requests on behalf of the user
-        After successful log in - updates property access_token of the user
+        After successful log in - updates property access_token of the user and headers for further requests
         :return:
         """
         if self.bot.settings.fake_api:
             return
 
-        response = requests.post(url=self.bot.settings.base_url + "user/login/",
-                                 json={'username': self.username, 'password': self.bot.settings.password})
-        self.access_token = response.json().get('access')
+        status, data = await self.bot.request('POST', "user/login/",
+                                              json={'username': self.username, 'password': self.bot.settings.password})
+        if status != 200 or not data.get('access'):
+            raise Exception(f'HTTP {status}: {data.get("message")}')
+        self.access_token = data['access']
+        self._cached_headers = {'Authorization': f'Bearer {self.access_token}'}
+
+    def _print_action(self, text):
+        """
+        Prints successful action of the user unless QUIET is set
+        :param text: text to print
+        :return: None
+        """
+        if not self.bot.settings.quiet:
+            print_info(text)
 
     @property
     def _headers(self):
         """
         :return: headers for request that requires log in
         """
-        return {'Authorization': 'Bearer ' + self.access_token}
+        return self._cached_headers
 
-    def create_post(self, content):
+    async def create_post(self, content):
         """
         Create post on behalf of the user. Requires self.login call beforehand
         :param content: content of the post
@@ -107,32 +172,60 @@ class User:
             post_id = self.bot.post_id
             self.bot.post_id += 1
         else:
-            response = requests.post(url=self.bot.settings.base_url + "post/create/",
-                                     json={'content': content},
-                                     headers=self._headers)
+            status, data = await self.bot.request('POST', "post/create/", retry_server_errors=False,
+                                                  json={'content': content}, headers=self._headers)
+            if status != 200:
+                print_error(f'Error creating post by user {self.username}: HTTP {status}: {data.get("message")}')
+                return
+
+            post_id = data.get('message')
 
-            post_id = response.json().get('message')
+        self._print_action(f'User {self.username} posted (post ID: {post_id}) {content}')
 
-        print_info(f'User {self.username} posted (post ID: {post_id}) {content}')
+        self.post_ids.append(post_id)
+        self.post_likes.append(0)
+        self._zero_like_posts.add(post_id)
 
-        self.own_posts_with_likes[post_id] = 0
+    def add_like(self, post_index):
+        """
+        Counts like of own post
+        :param post_index: index of the own post in self.post_ids
+        :return: None
+        """
+        self.post_likes[post_index] += 1
+        self._zero_like_posts.discard(self.post_ids[post_index])
 
-    def like_post(self, post_id):
+    async def like_post(self, post_id):
         """
         User likes post with certain id. Requires self.login call beforehand
         :param post_id: ID of the post to like
         :return: None
         """
         if not self.bot.settings.fake_api:
-            response = requests.get(url=self.bot.settings.base_url + f'post/{post_id}/like',
-                                    headers=self._headers)
-            if response.status_code != 200 or response.json().get('status') != 'success':
-                print_error(f'Error liking post {post_id}: {response.json().get("message")}')
+            status, data = await self.bot.request('GET', f'post/{post_id}/like', headers=self._headers)
+            if status != 200 or data.get('status') != 'success':
+                print_error(f'Error liking post {post_id}: HTTP {status}: {data.get("message")}')
                 return
 
-        print_info(f'Post with ID {post_id} liked by user {self.username} successfully')
+        self._print_action(f'Post with ID {post_id} liked by user {self.username} successfully')
         self.posts_liked.add(post_id)
 
+    async def like_posts_batch(self, post_ids):
+        """
+        User likes several posts with one request to bulk endpoint. Requires self.login call beforehand
+        :param post_ids: IDs of the posts to like
+        :return: None
+        """
+        if not self.bot.settings.fake_api:
+            status, data = await self.bot.request('POST', 'post/likes/batch/', json={'post_ids': post_ids},
+                                                  headers=self._headers)
+            if status != 200 or data.get('status') != 'success':
+                print_error(f'Error liking posts {post_ids}: HTTP {status}: {data.get("message")}')
+                return
+
+        self._print_action(f'Posts with IDs {post_ids} liked by user {self.username} successfully')
+        self.posts_liked.update(post_ids)
+
     def is_likeable(self, by_user=None):  # user can be liked if there is at least one post with 0 likes
         """
         Validates if the user can be liked by other user 'by_user' (every user can like one post once)
@@ -141,50 +234,63 @@ class User:
         :return: True if this user can be liked, False - otherwise
         """
 
-        posts_liked = set() if by_user is None else by_user.posts_liked
-        return 0 in [likes_cnt for post, likes_cnt in self.own_posts_with_likes.items() if post not in posts_liked]
+        if by_user is None:
+            return bool(self._zero_like_posts)
+        return not self._zero_like_posts <= by_user.posts_liked  # subset check does not build a new set
 
     @property
-    def random_post(self):
+    def random_post_index(self):
         """
-        :return: ID of the random post created by the user
+        :return: index of the random post created by the user in self.post_ids
         """
-        posts = [post_id for post_id in self.own_posts_with_likes.keys()]
-        return posts[randint(0, len(posts) - 1)]
+        return randint(0, len(self.post_ids) - 1)
 
-    def can_like(self, users):
+    def can_like(self, others, max_likes, pending=()):
         """
         Validates if the user can like anyone. I.e.:
         1. User didn't reach max amount of likes
         2. There are other users that this user can like
-        :param users: all users
+        :param others: all users except this one
+        :param max_likes: maximum amount of likes per user
+        :param pending: posts picked to be liked by the user but not sent yet
         :return: True if user can like someone, false - otherwise
         """
-        if len(self.posts_liked) >= self.bot.settings.max_likes_per_user:
+        if len(self.posts_liked) + len(pending) >= max_likes:
             return False
 
-        return True in set((user.is_likeable(self) for user in users if user != self))
+        return any(user.is_likeable(self) for user in others)
 
     def __eq__(self, other):
         return self.username == other.username
 
+    def __hash__(self):
+        return hash(self.username)
+
 
 class Bot:
     class Settings:
+        __slots__ = ('fake_api', 'quiet', 'base_url', 'password', 'email', 'number_of_users', 'max_posts_per_user',
+                     'max_likes_per_user', 'likes_batch_size', 'max_concurrency', 'max_retries', 'retry_backoff')
+
         def __init__(self, ini_file):
             conf = ConfigParser()
             conf.read(ini_file)
 
             settings = conf['Settings']
-            self.fake_api = settings.get('FAKE_API', '')
+            self.fake_api = _get_flag(settings, 'FAKE_API')
+            self.quiet = _get_flag(settings, 'QUIET')
             self.base_url = settings.get('BASE_URL', '')
             self.password = settings.get('PASSWORD', '')
             self.email = settings.get('EMAIL', '')
 
             limits = conf['Limits']
-            self.number_of_users = int(limits.get('number_of_users', '0'))
-            self.max_posts_per_user = int(limits.get('max_posts_per_user', '0'))
-            self.max_likes_per_user = int(limits.get('max_likes_per_user', '0'))
+            self.number_of_users = limits.getint('number_of_users', fallback=0)
+            self.max_posts_per_user = limits.getint('max_posts_per_user', fallback=0)
+            self.max_likes_per_user = limits.getint('max_likes_per_user', fallback=0)
+            self.likes_batch_size = _get_int(limits, 'likes_batch_size', 0, minimum=0)
+            self.max_concurrency = _get_int(limits, 'max_concurrency', 64, minimum=1)
+            self.max_retries = limits.getint('max_retries', fallback=5)
+            self.retry_backoff = limits.getfloat('retry_backoff', fallback=0.5)
 
     def __init__(self, ini_file):
         self.settings = self.Settings(ini_file)
@@ -193,9 +299,10 @@ class Bot:
         # each their post will be a random English word definition from the dictionary
 
         try:
-            with open('dictionary.json', 'r', errors='ignore') as file:
-                dictionary = json.load(file)
-                dictionary = [(key, value[0]) for key, value in dictionary.items()]
+            with open('dictionary.json', 'rb') as file:
+                dictionary = orjson.loads(file.read())  # bytes are parsed directly without decoding to str
+                # contents are formatted once here to avoid formatting on each post
+                dictionary = tuple(f'{key.capitalize()} - {value[0]}' for key, value in dictionary.items())
         except FileNotFoundError as e:
             raise FileNotFoundError('Bot requires dictionary.json with data') from e
 
@@ -205,6 +312,8 @@ class Bot:
         self.current_step = 1
 
         self.users = []
+        self.http = None  # aiohttp.ClientSession shared by all users, opened in self.run
+        self.semaphore = None  # limits the number of API calls in flight, created in self.run
 
     @property
     def get_random_post_content(self):
@@ -212,15 +321,14 @@ class Bot:
         Returns content for the post from dictionary.json
         :return: random content for the post.
         """
-        entry = self.dictionary[randint(0, len(self.dictionary) - 1)]
-        return f'{entry[0].capitalize()} - {entry[1]}'
+        return choice(self.dictionary)
 
     def is_posts_left(self):
         """
         Validates if there are posts with no likes left
         :return: True if there is at least one post to like, False - otherwise
         """
-        return True in set((user.is_likeable() for user in self.users))
+        return any(user.is_likeable() for user in self.users)
 
     def is_users_left(self):
         """
@@ -229,74 +337,182 @@ class Bot:
         """
         if len(self.users) < 2:
             return False
-        return True in set((len(user.posts_liked) < self.settings.max_likes_per_user for user in self.users))
+        max_likes = self.settings.max_likes_per_user
+        return any(len(user.posts_liked) < max_likes for user in self.users)
 
     def _print_step(self, text):
         print("-------------------------------------------------------------------------------------------------------")
         print_info(f'Step {self.current_step}: {text}')
         print("-------------------------------------------------------------------------------------------------------")
+        sys.stdout.flush()  # show the progress when output is buffered (QUIET)
         self.current_step += 1
 
-    def signup_users(self):
+    async def run(self):
         """
-        Registers users according to the number set in settings
+        Executes the complete flow of the bot within one HTTP session shared by all users
+        :return: None
+        """
+        if self.settings.quiet:
+            # output is flushed after each step instead of each line
+            sys.stdout.reconfigure(line_buffering=False)
+
+        # usernames are generated in background thread while HTTP session is being set up
+        # 20% of spare usernames replace the ones that fail to sign up (e.g. already taken)
+        number_of_usernames = self.settings.number_of_users + self.settings.number_of_users // 5 + 1
+        usernames = asyncio.get_running_loop().run_in_executor(None, generate_username, number_of_usernames)
+
+        self.semaphore = asyncio.Semaphore(self.settings.max_concurrency)
+        # connections are kept alive and reused by all users, so TCP handshake and DNS lookup are done once
+        connector = aiohttp.TCPConnector(limit=1024, limit_per_host=self.settings.max_concurrency,
+                                         keepalive_timeout=60, ttl_dns_cache=None)
+        async with aiohttp.ClientSession(connector=connector) as self.http:
+            await self.signup_users(await usernames)
+            await self.create_posts()
+            await self.like_posts()
+        self.print_results()
+
+    async def request(self, method, endpoint, retry_server_errors=True, **kwargs):
+        """
+        Calls API endpoint. The number of concurrent calls is limited by max_concurrency.
+        If the server is overloaded (HTTP 429 or 5xx) - the call is repeated up to max_retries times
+        with exponential backoff (or after the delay given by the server in Retry-After header).
+        Calls that must not be repeated after the server might have processed them (e.g. sign-up or creation
+        of a post, that would be duplicated) should set retry_server_errors to False - then only HTTP 429 is retried
+        :param method: HTTP method
+        :param endpoint: endpoint relative to base URL
+        :param retry_server_errors: False to retry HTTP 429 only, but not 5xx
+        :param kwargs: arguments passed to aiohttp request (json, headers, etc.)
+        :return: tuple (HTTP status, JSON of the response or empty dict if the response is not JSON)
+        """
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                async with self.http.request(method, self.settings.base_url + endpoint, **kwargs) as response:
+                    retriable = response.status == 429 or (retry_server_errors and response.status >= 500)
+                    if not retriable or attempt >= self.settings.max_retries:
+                        try:
+                            # error pages of proxies are not JSON, callers handle it via HTTP status
+                            data = await response.json(content_type=None)
+                        except ValueError:
+                            data = None
+                        return response.status, data if isinstance(data, dict) else {}
+                    delay = _retry_after(response)
+
+            if delay is None:
+                delay = self.settings.retry_backoff * 2 ** attempt + uniform(0, self.settings.retry_backoff)
+            print_error(f'{method} {endpoint} failed with HTTP {response.status}. Retry in {delay:.2f} sec')
+            await asyncio.sleep(delay)  # sleep outside of semaphore to let other calls proceed
+            attempt += 1
+
+    async def signup_users(self, usernames):
+        """
+        Registers users according to the number set in settings.
+        Sign-up requests for all users are sent concurrently.
+        Skipped usernames are replaced with spare ones while there are any left
+        :param usernames: usernames to sign up, the ones after number of users are spare
         :return: None
         """
         self._print_step(f'Sign up {self.settings.number_of_users} users')
-        for user in [User(self, username) for username in generate_username(self.settings.number_of_users)]:
-            try:
-                user.sign_up(self.settings.password, self.settings.email)
-                self.users.append(user)
-            except Exception as e:
-                print_error(f'Username {user.username} skipped. Error: {str(e)}')
+        pending = usernames[:self.settings.number_of_users]
+        spare = usernames[self.settings.number_of_users:]
+        while pending:
+            results = await asyncio.gather(*[self._sign_up(username) for username in pending])
+            skipped = results.count(False)
+            pending, spare = spare[:skipped], spare[skipped:]
+
+    async def _sign_up(self, username):
+        """
+        Creates user and signs it up. Successfully registered user is added to self.users
+        :param username: username of the new user
+        :return: True if the user is registered, False - otherwise
+        """
+        user = User(self, username)
+        try:
+            await user.sign_up(self.settings.password, self.settings.email)
+        except Exception as e:
+            print_error(f'Username {username} skipped. Error: {str(e)}')
+            return False
+        self.users.append(user)
+        return True
 
-    def create_posts(self):
+    async def create_posts(self):
         """
         Creates random amount of posts (up to maximum value) for each registered user
         :return: None
         """
-        self._print_step(
-            f'Each user creates random number of posts (up to {self.settings.max_posts_per_user}) with any content')
+        max_posts = self.settings.max_posts_per_user
+        self._print_step(f'Each user creates random number of posts (up to {max_posts}) with any content')
         for user in self.users:
-            user.login()
-            for _ in range(randint(1, self.settings.max_posts_per_user)):
-                user.create_post(self.get_random_post_content)
+            try:
+                await user.login()
+            except Exception as e:
+                print_error(f'User {user.username} can not log in to create posts. Error: {str(e)}')
+                continue
+            await asyncio.gather(*[user.create_post(self.get_random_post_content)
+                                   for _ in range(randint(1, max_posts))])
 
-    def like_posts(self):
+    async def like_posts(self):
         """
         Performs liking activity according to the rules described in separate document
         Does liking until there are posts to like and there are users who can like
         :return: None
         """
         self._print_step('Start liking')
+        users = self.users
+        batch_size = self.settings.likes_batch_size
+        max_likes = self.settings.max_likes_per_user
 
         # next user to perform a like is the user who has most posts and has not reached max likes
-        # create queue sorted by number of posts per user
-        users_queue = sorted(self.users, key=lambda _user: _user.posts_count, reverse=True)
+        # create priority queue by number of posts per user (index keeps order of users with equal posts)
+        users_queue = [(-user.posts_count, i, user) for i, user in enumerate(users)]
+        heapq.heapify(users_queue)
 
         while True:  # like posts until:
             if not self.is_posts_left():  # 1. there is no posts with 0 likes
                 print_info('All posts are liked at least once. Stop bot')
                 break
 
-            if not self.is_users_left():  # 2. there are available users to like
+            if not users_queue or not self.is_users_left():  # 2. there are available users to like
                 print_info('No more users able to like. Stop bot')
                 break
 
             # user performs “like” activity until he reaches max likes (and there are someone left to like)
-            for user in users_queue:
-                user.login()
-                while user.can_like(self.users):
-                    for user_to_like in self.users:
-                        if user_to_like == user or not user_to_like.is_likeable(user):
-                            continue  # do not like their own posts or users without posts with no likes
-
-                        post_to_like = user_to_like.random_post
-                        if post_to_like in user.posts_liked:  # can't like same post twice
-                            continue
-
-                        user_to_like.own_posts_with_likes[post_to_like] += 1
-                        user.like_post(post_to_like)
+            # after that the user is not queued again: posts with no likes never appear during liking,
+            # so the user is not able to like anymore
+            _, _, user = heapq.heappop(users_queue)
+            try:
+                await user.login()
+            except Exception as e:
+                print_error(f'User {user.username} can not log in to like posts. Error: {str(e)}')
+                continue
+            others = [other for other in users if other is not user]  # do not like their own posts
+            posts_liked = user.posts_liked
+            pending = []  # posts collected for batched likes, sent when there are batch_size of them
+            while user.can_like(others, max_likes, pending):
+                # posts picked in one pass belong to different users, so they can be liked concurrently
+                posts_to_like = []
+                for user_to_like in others:
+                    if not user_to_like.is_likeable(user):
+                        continue  # do not like users without posts with no likes
+
+                    post_index = user_to_like.random_post_index
+                    post_to_like = user_to_like.post_ids[post_index]
+                    if post_to_like in posts_liked or post_to_like in pending:  # can't like same post twice
+                        continue
+
+                    user_to_like.add_like(post_index)
+                    posts_to_like.append(post_to_like)
+
+                if batch_size:
+                    pending.extend(posts_to_like)
+                    while len(pending) >= batch_size:
+                        await user.like_posts_batch(pending[:batch_size])
+                        pending = pending[batch_size:]
+                else:
+                    await asyncio.gather(*[user.like_post(post_id) for post_id in posts_to_like])
+
+            if pending:  # user is not able to like anymore - send the rest
+                await user.like_posts_batch(pending)
 
     def print_results(self):
         print('----------------------')
@@ -305,18 +521,14 @@ class Bot:
         print("Details: ")
         for user in self.users:
             print("Username: ", user.username)
-            print("Own posts (post_id, number of likes): ", user.own_posts_with_likes)
+            print("Own posts (post_id, number of likes): ", dict(zip(user.post_ids, user.post_likes)))
             print()
 
 
-def main():
+async def main():
     bot = Bot('settings.ini')
-
-    bot.signup_users()
-    bot.create_posts()
-    bot.like_posts()
-    bot.print_results()
+    await bot.run()
 
 
 if __name__ == '__main__':
-    main()
+    asyncio.run(main())